@@ -0,0 +1,373 @@
+import html
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+
+class ClassMistakeData:
+    """
+    全班错题的列式存储
+
+    每道题占一行：q_student、q_exam为学生和考试的编号，q_created为添加时间
+    (datetime64[m]，缺失时为NaT)。知识点以(题目行号, 知识点编号)对的形式
+    存在kp_question、kp_index中，空知识点在加载时就被过滤掉。
+    """
+
+    def __init__(self, students, exams, knowledge_points, q_student, q_exam, q_created, kp_question, kp_index):
+        self.students = students
+        self.exams = exams
+        self.knowledge_points = knowledge_points
+        self.q_student = q_student
+        self.q_exam = q_exam
+        self.q_created = q_created
+        self.kp_question = kp_question
+        self.kp_index = kp_index
+
+
+def load_class_data(json_file_paths):
+    """
+    读取全班学生的错题本JSON文件，转换为列式存储
+
+    参数:
+    json_file_paths -- 学生错题本JSON文件路径列表
+
+    返回:
+    ClassMistakeData实例
+    """
+    students = []
+    exam_ids = {}
+    kp_ids = {}
+    q_student, q_exam, q_created = [], [], []
+    kp_question, kp_index = [], []
+
+    for json_file_path in json_file_paths:
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        student = len(students)
+        students.append(f"{data.get('name', '')}({data.get('student_id', '')})")
+        for question in data.get('questions', []):
+            row = len(q_student)
+            q_student.append(student)
+            q_exam.append(exam_ids.setdefault(question.get('exam_name', '未分类'), len(exam_ids)))
+            q_created.append(question.get('created_at') or 'NaT')
+            for kp in question.get('knowledge_points', []):
+                if kp:  # 只统计非空的知识点
+                    kp_question.append(row)
+                    kp_index.append(kp_ids.setdefault(kp, len(kp_ids)))
+
+    return ClassMistakeData(
+        students=students,
+        exams=list(exam_ids),
+        knowledge_points=list(kp_ids),
+        q_student=np.array(q_student, dtype=np.int32),
+        q_exam=np.array(q_exam, dtype=np.int32),
+        q_created=np.array(q_created, dtype='datetime64[m]'),
+        kp_question=np.array(kp_question, dtype=np.int32),
+        kp_index=np.array(kp_index, dtype=np.int32),
+    )
+
+
+def exam_order(class_data):
+    """
+    按每场考试最早一道错题的添加时间给考试排序，没有时间的考试排在最后
+
+    参数:
+    class_data -- ClassMistakeData实例
+
+    返回:
+    考试编号数组
+    """
+    n_exams = len(class_data.exams)
+    created = class_data.q_created.astype(np.int64)
+    valid = ~np.isnat(class_data.q_created)
+    first_seen = np.full(n_exams, np.iinfo(np.int64).max)
+    np.minimum.at(first_seen, class_data.q_exam[valid], created[valid])
+    return np.argsort(first_seen, kind='stable')
+
+
+def error_matrix(class_data):
+    """
+    统计知识点×考试的错题数
+
+    参数:
+    class_data -- ClassMistakeData实例
+
+    返回:
+    形状为(知识点数, 考试数)的整数矩阵
+    """
+    n_kps, n_exams = len(class_data.knowledge_points), len(class_data.exams)
+    cells = class_data.kp_index.astype(np.int64) * n_exams + class_data.q_exam[class_data.kp_question]
+    return np.bincount(cells, minlength=n_kps * n_exams).reshape(n_kps, n_exams)
+
+
+def student_counts(class_data):
+    """
+    统计每个知识点有多少名学生出错（同一学生多次出错只算一次）
+
+    参数:
+    class_data -- ClassMistakeData实例
+
+    返回:
+    长度为知识点数的整数数组
+    """
+    n_kps, n_students = len(class_data.knowledge_points), len(class_data.students)
+    # 用布尔矩阵标记出过错的(知识点, 学生)对，避免对全部记录排序去重
+    seen = np.zeros(n_kps * n_students, dtype=bool)
+    seen[class_data.kp_index.astype(np.int64) * n_students + class_data.q_student[class_data.kp_question]] = True
+    return seen.reshape(n_kps, n_students).sum(axis=1)
+
+
+def monthly_matrix(class_data):
+    """
+    统计知识点×月份的错题数，没有添加时间的题目不计入
+
+    参数:
+    class_data -- ClassMistakeData实例
+
+    返回:
+    (连续的月份数组, 形状为(知识点数, 月份数)的整数矩阵)
+    """
+    n_kps = len(class_data.knowledge_points)
+    valid_questions = ~np.isnat(class_data.q_created)
+    if not valid_questions.any():
+        return np.array([], dtype='datetime64[M]'), np.zeros((n_kps, 0), dtype=np.int64)
+
+    # 先按题目换算月份编号，再按知识点记录取用，月份范围内没有错题的月份计为0
+    question_months = class_data.q_created.astype('datetime64[M]').astype(np.int64)
+    first_month = question_months[valid_questions].min()
+    n_months = int(question_months[valid_questions].max() - first_month) + 1
+
+    valid = valid_questions[class_data.kp_question]
+    month_index = question_months[class_data.kp_question[valid]] - first_month
+    cells = class_data.kp_index[valid].astype(np.int64) * n_months + month_index
+    counts = np.bincount(cells, minlength=n_kps * n_months).reshape(n_kps, n_months)
+    months = np.arange(first_month, first_month + n_months).astype('datetime64[M]')
+    return months, counts
+
+
+def trend_slopes(counts):
+    """
+    对每个知识点的按时间序列错题数做最小二乘直线拟合，返回斜率
+
+    参数:
+    counts -- 形状为(知识点数, 时间段数)的矩阵
+
+    返回:
+    长度为知识点数的斜率数组；时间段少于2个时全为0
+    """
+    n_periods = counts.shape[1]
+    if n_periods < 2:
+        return np.zeros(counts.shape[0])
+    x = np.arange(n_periods) - (n_periods - 1) / 2
+    return (counts - counts.mean(axis=1, keepdims=True)) @ x / (x @ x)
+
+
+def top_weak_points(matrix, n=10):
+    """
+    找出全班错题数最多的前n个知识点
+
+    参数:
+    matrix -- error_matrix()的结果
+    n -- 返回的知识点个数
+
+    返回:
+    知识点编号数组，按错题数从多到少排列
+    """
+    totals = matrix.sum(axis=1)
+    n = min(n, len(totals))
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-totals, n - 1)[:n]
+    return top[np.argsort(-totals[top], kind='stable')]
+
+
+def generate_class_report_html(json_file_paths, output_html_path, top_n=20):
+    """
+    生成全班知识点薄弱情况汇总页
+
+    参数:
+    json_file_paths -- 学生错题本JSON文件路径列表
+    output_html_path -- 输出HTML文件路径
+    top_n -- 汇总页展示的知识点个数
+    """
+    class_data = load_class_data(json_file_paths)
+
+    matrix = error_matrix(class_data)
+    students = student_counts(class_data)
+    months, monthly = monthly_matrix(class_data)
+    slopes = trend_slopes(monthly)
+    exams = exam_order(class_data)
+    top = top_weak_points(matrix, top_n)
+    # 知识点和考试名称可能来自录入服务的提交，转义后再放进页面
+    kp_names = {kp: html.escape(class_data.knowledge_points[kp]) for kp in top}
+
+    html_content = f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>全班错题分析</title>
+    <style>
+        * {{
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }}
+        body {{
+            font-family: "PingFang SC", "Microsoft YaHei", sans-serif;
+            color: #333;
+            background-color: #f5f5f5;
+            padding: 20px;
+            line-height: 1.6;
+        }}
+        .container {{
+            max-width: 1200px;
+            margin: 0 auto;
+            background-color: white;
+            box-shadow: 0 0 15px rgba(0, 0, 0, 0.1);
+            border-radius: 8px;
+            overflow: hidden;
+        }}
+        header {{
+            background-color: #4285f4;
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }}
+        .summary-info {{
+            display: flex;
+            justify-content: space-between;
+            margin-bottom: 10px;
+        }}
+        .report-container {{
+            padding: 20px;
+            overflow-x: auto;
+        }}
+        .section-header {{
+            background-color: #f1f8ff;
+            padding: 10px 15px;
+            margin: 20px 0 15px 0;
+            border-left: 4px solid #4285f4;
+            font-weight: bold;
+        }}
+        table {{
+            border-collapse: collapse;
+            width: 100%;
+            font-size: 0.9em;
+        }}
+        th, td {{
+            border: 1px solid #e0e0e0;
+            padding: 6px 10px;
+            text-align: center;
+            white-space: nowrap;
+        }}
+        th {{
+            background-color: #f5f9ff;
+        }}
+        td.kp-name {{
+            text-align: left;
+        }}
+        .trend-up {{
+            color: #d32f2f;
+        }}
+        .trend-down {{
+            color: #388e3c;
+        }}
+        .footer {{
+            text-align: center;
+            padding: 20px;
+            color: #757575;
+            font-size: 0.9em;
+            border-top: 1px solid #e0e0e0;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <header>
+            <h1>全班错题分析</h1>
+            <div class="summary-info">
+                <p>学生: {len(class_data.students)}人 - 错题: {len(class_data.q_student)}道 - 知识点: {len(class_data.knowledge_points)}个</p>
+                <p>生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            </div>
+        </header>
+
+        <div class="report-container">
+            <div class="section-header">薄弱知识点 Top {len(top)}</div>
+            <table>
+                <tr><th>排名</th><th>知识点</th><th>错题数</th><th>出错人数</th><th>趋势(每月)</th></tr>
+"""
+
+    totals = matrix.sum(axis=1)
+    for rank, kp in enumerate(top, start=1):
+        slope = slopes[kp]
+        trend_class = "trend-up" if slope > 0 else "trend-down" if slope < 0 else ""
+        trend_mark = "↑" if slope > 0 else "↓" if slope < 0 else "-"
+        html_content += f"""                <tr><td>{rank}</td><td class="kp-name">{kp_names[kp]}</td><td>{totals[kp]}</td><td>{students[kp]}</td><td class="{trend_class}">{trend_mark} {slope:+.2f}</td></tr>
+"""
+
+    html_content += """            </table>
+
+            <div class="section-header">知识点 × 考试 错题数</div>
+            <table>
+                <tr><th>知识点</th>"""
+    for exam in exams:
+        html_content += f"<th>{html.escape(class_data.exams[exam])}</th>"
+    html_content += "</tr>\n"
+
+    # 按单元格数值深浅着色，便于一眼看出集中出错的考试
+    peak = max(int(matrix[top].max()) if len(top) else 0, 1)
+    for kp in top:
+        html_content += f'                <tr><td class="kp-name">{kp_names[kp]}</td>'
+        for exam in exams:
+            count = matrix[kp, exam]
+            alpha = count / peak * 0.6
+            html_content += f'<td style="background-color: rgba(255, 87, 34, {alpha:.2f})">{count or ""}</td>'
+        html_content += "</tr>\n"
+
+    html_content += """            </table>
+
+            <div class="section-header">知识点 × 月份 错题数</div>
+            <table>
+                <tr><th>知识点</th>"""
+    for month in months:
+        html_content += f"<th>{month}</th>"
+    html_content += "</tr>\n"
+    for kp in top:
+        html_content += f'                <tr><td class="kp-name">{kp_names[kp]}</td>'
+        for count in monthly[kp]:
+            html_content += f"<td>{count or ''}</td>"
+        html_content += "</tr>\n"
+
+    html_content += """            </table>
+        </div>
+
+        <div class="footer">
+            <p>错题本 - 学习进步的阶梯</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+    # 保存HTML文件
+    with open(output_html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+    return output_html_path
+
+def main():
+    # 用法: python analytics.py 学生1.json 学生2.json ...
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    json_files = sys.argv[1:] or [os.path.join(script_dir, 'data.json')]
+    output_html = os.path.join(script_dir, 'class_report.html')
+
+    generated_html = generate_class_report_html(json_files, output_html)
+    print(f"全班错题分析已生成：{generated_html}")
+
+if __name__ == "__main__":
+    main()
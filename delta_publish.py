@@ -0,0 +1,425 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime
+
+from image_store import open_default_store
+from mistake_notebook_generator_v2 import (collect_image_paths, get_image_tag, get_mime_type, group_questions_by_exam,
+                                           render_page_footer, render_page_header, render_question_card)
+from question_model import load_notebook
+from thumbnails import build_thumbnails, file_digest
+
+# 保留最近若干个版本的增量包；本地缓存更旧的读者改为下载完整快照
+KEEP_BUNDLES = 30
+MANIFEST_FILE = 'manifest.json'
+SNAPSHOT_FILE = 'snapshot.json'
+BUNDLE_DIR = 'bundles'
+# 点击查看的原图复制到发布目录下，按内容摘要命名，发布目录作为网站根目录时也能访问
+ORIGINAL_DIR = 'originals'
+
+
+def write_file_atomic(file_path, content):
+    """
+    先写临时文件再改名，读者不会读到写了一半的文件
+
+    参数:
+    file_path -- 文件路径
+    content -- 文件内容(str)
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def read_manifest(output_dir):
+    """
+    读取上一次发布的清单
+
+    参数:
+    output_dir -- 发布目录
+
+    返回:
+    清单字典；尚未发布过时返回版本为0的空清单
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"version": 0, "min_version": 0, "sections": [], "cards": {}, "images": {}}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def publish_original(image_path, output_dir, digest=None):
+    """
+    将原图复制到发布目录的originals目录，内容相同的图片只复制一次
+
+    参数:
+    image_path -- 原图路径
+    output_dir -- 发布目录
+    digest -- 原图内容摘要，已经算过时可以传入以免重复读文件
+
+    返回:
+    相对于发布目录的原图路径，如originals/<摘要>.jpg
+    """
+    if digest is None:
+        digest = file_digest(image_path)
+    ext = os.path.splitext(image_path)[1].lower() or '.jpg'
+    relative_path = f"{ORIGINAL_DIR}/{digest}{ext}"
+    published_path = os.path.join(output_dir, ORIGINAL_DIR, digest + ext)
+    if not os.path.exists(published_path):
+        os.makedirs(os.path.dirname(published_path), exist_ok=True)
+        tmp_path = f"{published_path}.tmp"
+        shutil.copyfile(image_path, tmp_path)
+        os.replace(tmp_path, published_path)
+    return relative_path
+
+
+def render_cards(notebook, output_dir, responsive_images=True):
+    """
+    渲染所有题目卡片；卡片中的图片以内容摘要引用，由页面从本地缓存中取出
+
+    参数:
+    notebook -- MistakeNotebook实例
+    output_dir -- 发布目录，点击查看的原图复制到其中
+    responsive_images -- 是否使用缩略图代替原图，点击后再加载原图
+
+    返回:
+    (分组 [[考试名称, [卡片编号, ...]], ...], {卡片编号: (摘要, HTML)}, {图片摘要: 图片路径},
+     {已发布原图的相对路径, ...})
+    """
+    thumbnails = build_thumbnails(collect_image_paths(notebook.questions)) if responsive_images else {}
+    images = {}
+    originals = set()
+
+    def image_tag(image_path, alt_text):
+        if not image_path or not os.path.isfile(image_path):
+            return get_image_tag(image_path, alt_text)
+        # 卡片中只放最大的一档缩略图，原图在点击时从发布目录加载
+        original_digest = file_digest(image_path)
+        digest, source_path = original_digest, image_path
+        if image_path in thumbnails:
+            source_path = thumbnails[image_path][-1][1]
+            digest = file_digest(source_path)
+        images[digest] = source_path
+        full_path = publish_original(image_path, output_dir, original_digest)
+        originals.add(full_path)
+        return (f'<img data-image="{digest}" alt="{alt_text}" class="expandable" '
+                f'data-full="{full_path}" onclick="expandImage(this)">')
+
+    sections = []
+    cards = {}
+    for exam_name, exam_questions in group_questions_by_exam(notebook.questions):
+        card_ids = []
+        for question in exam_questions:
+            card_id = question.question_id
+            # 题号重复时加序号，保证卡片编号唯一
+            suffix = 1
+            while card_id in cards:
+                suffix += 1
+                card_id = f"{question.question_id}~{suffix}"
+            card_html = render_question_card(exam_name, question, image_tag=image_tag)
+            cards[card_id] = (hashlib.sha1(card_html.encode('utf-8')).hexdigest(), card_html)
+            card_ids.append(card_id)
+        sections.append([exam_name, card_ids])
+    return sections, cards, images, originals
+
+
+def encode_images(images, digests):
+    """
+    将图片编码为base64，放入增量包或快照
+
+    参数:
+    images -- {图片摘要: 图片路径}
+    digests -- 需要编码的图片摘要
+
+    返回:
+    {图片摘要: {"mime": MIME类型, "data": base64数据}}
+    """
+    encoded = {}
+    for digest in sorted(digests):
+        with open(images[digest], 'rb') as f:
+            encoded[digest] = {"mime": get_mime_type(images[digest]), "data": base64.b64encode(f.read()).decode('ascii')}
+    return encoded
+
+
+def render_shell(notebook):
+    """
+    生成页面外壳：不包含任何卡片和生成时间，内容不变时字节也不变，浏览器可以一直使用缓存
+
+    参数:
+    notebook -- MistakeNotebook实例
+
+    返回:
+    HTML字符串
+    """
+    return (render_page_header(notebook.student_id, notebook.name, '<span id="generated-at"></span>')
+            + """            <div id="notebook"></div>
+"""
+            + render_page_footer(DELTA_CLIENT_SCRIPT.replace('__DB_NAME__', f"mistake-notebook-{notebook.student_id}")))
+
+
+def publish_notebook(json_file_path, output_dir, image_store=None, responsive_images=True):
+    """
+    发布错题本的新版本：清单记录每张卡片的内容摘要，增量包只包含新增、修改和删除的卡片与图片
+
+    发布目录结构:
+    index.html        -- 页面外壳，用IndexedDB缓存卡片和图片，只下载缺少的增量包
+    manifest.json     -- 发布编号、当前版本号、分组和每张卡片的内容摘要
+    bundles/v<N>.json -- 从版本N-1到版本N的增量包
+    snapshot.json     -- 当前版本的完整内容，供首次打开或缓存过旧的读者使用
+    originals/        -- 点击查看的原图，以内容摘要命名
+
+    参数:
+    json_file_path -- JSON文件路径
+    output_dir -- 发布目录
+    image_store -- 共享图片库ImageStore，可以为None，传给load_notebook()
+    responsive_images -- 是否使用缩略图代替原图
+
+    返回:
+    发布后的版本号；内容没有变化时不产生新版本
+    """
+    notebook = load_notebook(json_file_path, image_store)
+    # 原图在这里就复制好，早于引用它们的清单
+    sections, cards, images, originals = render_cards(notebook, output_dir, responsive_images)
+
+    os.makedirs(os.path.join(output_dir, BUNDLE_DIR), exist_ok=True)
+    shell_path = os.path.join(output_dir, 'index.html')
+    shell = render_shell(notebook)
+    previous_shell = None
+    if os.path.exists(shell_path):
+        with open(shell_path, 'r', encoding='utf-8') as f:
+            previous_shell = f.read()
+    if previous_shell != shell:
+        write_file_atomic(shell_path, shell)
+
+    previous = read_manifest(output_dir)
+    card_hashes = {card_id: card_hash for card_id, (card_hash, _) in cards.items()}
+    changed_cards = [card_id for card_id, card_hash in card_hashes.items() if previous['cards'].get(card_id) != card_hash]
+    removed_cards = sorted(set(previous['cards']) - set(cards))
+    new_images = set(images) - set(previous['images'])
+    removed_images = sorted(set(previous['images']) - set(images))
+
+    if previous['version'] and not (changed_cards or removed_cards or new_images or removed_images
+                                    or sections != previous['sections']):
+        return previous['version']
+
+    version = previous['version'] + 1
+    generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # 发布编号在首次发布时随机生成；发布目录被清空重建后版本号从1重新开始，
+    # 读者据此发现本地缓存属于另一次发布，改为下载完整快照
+    lineage = previous.get('lineage') or uuid.uuid4().hex
+
+    # 先写增量包和快照，最后写清单，读者看到新清单时增量包一定已经存在
+    bundle = {
+        "version": version,
+        "base": version - 1,
+        "cards": {card_id: {"hash": cards[card_id][0], "html": cards[card_id][1]} for card_id in changed_cards},
+        "removed_cards": removed_cards,
+        "images": encode_images(images, new_images),
+        "removed_images": removed_images,
+    }
+    write_file_atomic(os.path.join(output_dir, BUNDLE_DIR, f"v{version}.json"), json.dumps(bundle, ensure_ascii=False))
+
+    snapshot = {
+        "version": version,
+        "base": 0,
+        "cards": {card_id: {"hash": card_hash, "html": card_html} for card_id, (card_hash, card_html) in cards.items()},
+        "removed_cards": [],
+        "images": encode_images(images, images),
+        "removed_images": [],
+    }
+    write_file_atomic(os.path.join(output_dir, SNAPSHOT_FILE), json.dumps(snapshot, ensure_ascii=False))
+
+    min_version = max(0, version - KEEP_BUNDLES)
+    manifest = {
+        "lineage": lineage,
+        "version": version,
+        "min_version": min_version,
+        "generated_at": generated_at,
+        "sections": sections,
+        "cards": card_hashes,
+        "images": {digest: get_mime_type(image_path) for digest, image_path in sorted(images.items())},
+    }
+    write_file_atomic(os.path.join(output_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    # 删除超出保留范围的旧增量包
+    for old_version in range(max(1, previous.get('min_version', 0)), min_version + 1):
+        old_bundle = os.path.join(output_dir, BUNDLE_DIR, f"v{old_version}.json")
+        if os.path.exists(old_bundle):
+            os.remove(old_bundle)
+
+    # 同步完成后读者的卡片都引用当前版本的原图，不再被引用的原图可以删除
+    original_dir = os.path.join(output_dir, ORIGINAL_DIR)
+    for filename in os.listdir(original_dir) if os.path.isdir(original_dir) else []:
+        if f"{ORIGINAL_DIR}/{filename}" not in originals:
+            os.remove(os.path.join(original_dir, filename))
+
+    return version
+
+
+# 页面中的增量同步脚本：卡片和图片存入IndexedDB，每次打开只下载本地缺少的增量包
+DELTA_CLIENT_SCRIPT = """
+    <script>
+        const DB_NAME = '__DB_NAME__';
+
+        function openDatabase() {
+            return new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('cards');
+                    db.createObjectStore('images');
+                    db.createObjectStore('meta');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+
+        function requestResult(request) {
+            return new Promise((resolve, reject) => {
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+
+        function base64ToBlob(image) {
+            const bytes = Uint8Array.from(atob(image.data), c => c.charCodeAt(0));
+            return new Blob([bytes], {type: image.mime});
+        }
+
+        // 在一个事务中应用一个增量包或快照，中途失败时本地缓存保持原样
+        function applyBundle(db, bundle, manifest) {
+            return new Promise((resolve, reject) => {
+                const tx = db.transaction(['cards', 'images', 'meta'], 'readwrite');
+                const cards = tx.objectStore('cards');
+                const images = tx.objectStore('images');
+                if (bundle.base === 0) {
+                    cards.clear();
+                    images.clear();
+                }
+                for (const [cardId, card] of Object.entries(bundle.cards)) {
+                    cards.put(card, cardId);
+                }
+                bundle.removed_cards.forEach(cardId => cards.delete(cardId));
+                for (const [digest, image] of Object.entries(bundle.images)) {
+                    images.put(base64ToBlob(image), digest);
+                }
+                bundle.removed_images.forEach(digest => images.delete(digest));
+                tx.objectStore('meta').put(bundle.version, 'version');
+                tx.objectStore('meta').put(manifest.lineage, 'lineage');
+                if (bundle.version === manifest.version) {
+                    tx.objectStore('meta').put(manifest, 'manifest');
+                }
+                tx.oncomplete = resolve;
+                tx.onerror = () => reject(tx.error);
+            });
+        }
+
+        async function fetchJson(url) {
+            const response = await fetch(url, {cache: 'no-cache'});
+            if (!response.ok) {
+                throw new Error(url + ': ' + response.status);
+            }
+            return response.json();
+        }
+
+        async function syncNotebook(db) {
+            const meta = db.transaction('meta').objectStore('meta');
+            const [storedVersion, localLineage] = await Promise.all([
+                requestResult(meta.get('version')), requestResult(meta.get('lineage')),
+            ]);
+            let manifest;
+            try {
+                manifest = await fetchJson('manifest.json');
+            } catch (e) {
+                // 离线时直接显示本地缓存
+                return requestResult(db.transaction('meta').objectStore('meta').get('manifest'));
+            }
+            // 版本号只在同一次发布内有意义，发布目录重建后本地缓存整体作废
+            const localVersion = localLineage === manifest.lineage ? (storedVersion || 0) : 0;
+            if (localVersion === manifest.version) {
+                return manifest;
+            }
+            if (localVersion > 0 && localVersion >= manifest.min_version && localVersion < manifest.version) {
+                for (let version = localVersion + 1; version <= manifest.version; version++) {
+                    await applyBundle(db, await fetchJson('bundles/v' + version + '.json'), manifest);
+                }
+            } else {
+                await applyBundle(db, await fetchJson('snapshot.json'), manifest);
+            }
+            return manifest;
+        }
+
+        function escapeHtml(text) {
+            return String(text).replace(/[&<>"']/g, c => ({
+                '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;',
+            })[c]);
+        }
+
+        async function renderNotebook(db, manifest) {
+            if (!manifest) {
+                return;
+            }
+            // 同一事务中一次性取出全部卡片和图片
+            const tx = db.transaction(['cards', 'images']);
+            const cards = tx.objectStore('cards');
+            const images = tx.objectStore('images');
+            const [cardIds, cardValues, digests, blobs] = await Promise.all([
+                requestResult(cards.getAllKeys()), requestResult(cards.getAll()),
+                requestResult(images.getAllKeys()), requestResult(images.getAll()),
+            ]);
+            const cardMap = new Map(cardIds.map((cardId, i) => [cardId, cardValues[i]]));
+            const imageMap = new Map(digests.map((digest, i) => [digest, blobs[i]]));
+
+            let html = '';
+            for (const [examName, sectionCardIds] of manifest.sections) {
+                html += '<div class="section-header">' + escapeHtml(examName) + '</div>';
+                for (const cardId of sectionCardIds) {
+                    const card = cardMap.get(cardId);
+                    html += card ? card.html : '';
+                }
+            }
+            const container = document.getElementById('notebook');
+            container.innerHTML = html;
+            for (const img of container.querySelectorAll('img[data-image]')) {
+                const blob = imageMap.get(img.dataset.image);
+                if (blob) {
+                    img.src = URL.createObjectURL(blob);
+                }
+            }
+            document.getElementById('generated-at').textContent = manifest.generated_at;
+        }
+
+        openDatabase().then(async db => {
+            let manifest;
+            try {
+                manifest = await syncNotebook(db);
+            } catch (e) {
+                // 同步失败时显示本地缓存的上一个版本
+                console.error(e);
+                manifest = await requestResult(db.transaction('meta').objectStore('meta').get('manifest'));
+            }
+            await renderNotebook(db, manifest);
+        });
+    </script>
+"""
+
+
+def main():
+    # 用法: python delta_publish.py [JSON文件] [发布目录]
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    json_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, 'data.json')
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(script_dir, 'notebook')
+
+    image_store = open_default_store()
+
+    version = publish_notebook(json_file, output_dir, image_store)
+    print(f"错题本已发布：{output_dir}（版本 {version}）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import sys
+import threading
+
+from thumbnails import file_digest
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时只合并内容完全相同的图片
+    Image = None
+
+# 全校共享的图片库目录，与data.json中的图片路径一样相对于工作目录
+STORE_DIR = 'store'
+INDEX_FILE = 'index.json'
+# 感知哈希的汉明距离不超过该值即视为同一张图片
+MAX_HAMMING_DISTANCE = 3
+# 64位哈希切成4段16位；距离不超过3时至少有一段完全相同，只需比较这些候选
+HASH_BANDS = 4
+BAND_BITS = 64 // HASH_BANDS
+# 哈希相近的候选还要在32×32灰度缩略图上逐像素比较，确认是同一张图片后才合并；
+# 只差一个字母的答案截图（如"1. B"和"1. C"）哈希可能完全相同，但缩略图上的最大差值很大
+SIGNATURE_SIZE = 32
+MAX_MEAN_DIFFERENCE = 1.5
+MAX_PIXEL_DIFFERENCE = 48
+MAX_ASPECT_DIFFERENCE = 0.02
+# 灰度范围小于该值的图片（空白、纯色截图）哈希没有区分度，只合并内容完全相同的
+MIN_CONTRAST = 16
+
+
+def compute_dhash(image_path):
+    """
+    计算图片的64位差值哈希(dHash)，缩放、重新压缩后的同一张图片哈希相近
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    64位整数；未安装Pillow时返回None
+    """
+    if Image is None:
+        return None
+    with Image.open(image_path) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (left > right)
+    return dhash
+
+
+def compute_signature(image_path):
+    """
+    计算用于确认近似重复的图片特征
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    (宽, 高, 32×32灰度像素)；未安装Pillow时返回None
+    """
+    if Image is None:
+        return None
+    with Image.open(image_path) as image:
+        width, height = image.size
+        pixels = image.convert('L').resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.LANCZOS).tobytes()
+    return width, height, pixels
+
+
+def is_same_image(signature, other):
+    """
+    判断两张感知哈希相近的图片是否是同一张图片（缩放、重新压缩后的副本）
+
+    参数:
+    signature -- compute_signature()的结果
+    other -- 另一张图片的compute_signature()结果
+
+    返回:
+    宽高比一致且缩略图逐像素差值都很小时返回True
+    """
+    width, height, pixels = signature
+    other_width, other_height, other_pixels = other
+    aspect, other_aspect = width / height, other_width / other_height
+    if abs(aspect - other_aspect) > MAX_ASPECT_DIFFERENCE * aspect:
+        return False
+    differences = [abs(a - b) for a, b in zip(pixels, other_pixels)]
+    return max(differences) <= MAX_PIXEL_DIFFERENCE and sum(differences) / len(differences) <= MAX_MEAN_DIFFERENCE
+
+
+def hash_bands(dhash):
+    """
+    将64位哈希切分为若干段，用于快速查找相近的哈希
+
+    参数:
+    dhash -- 64位整数
+
+    返回:
+    [(段号, 段值), ...]
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (dhash >> (band * BAND_BITS)) & mask) for band in range(HASH_BANDS)]
+
+
+class ImageStore:
+    """
+    全校共享的图片库：相同或几乎相同的图片只保留一份规范副本
+
+    索引文件记录每份副本的内容摘要和感知哈希，以及原始路径到副本的映射，
+    生成器通过resolve()把data.json中的路径换成规范副本的路径。
+    感知哈希只用来找候选，候选经过逐像素比较确认后才合并；
+    同一张图片以像素最多的一份为规范副本，先收到低分辨率截图时，之后的高分辨率扫描件会替换它。
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+        self.images = {}   # 内容摘要 -> {"path": 副本路径, "dhash": 十六进制哈希或None}
+        self.aliases = {}  # 原始路径 -> 内容摘要
+        self.bands = {}    # (段号, 段值) -> [内容摘要, ...]
+        self.signatures = {}  # 内容摘要 -> compute_signature()的结果，按需计算
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.images = index.get('images', {})
+            self.aliases = index.get('aliases', {})
+            for digest, image in self.images.items():
+                if image.get('dhash'):
+                    self._index_dhash(digest, int(image['dhash'], 16))
+
+    def _index_dhash(self, digest, dhash):
+        for band in hash_bands(dhash):
+            self.bands.setdefault(band, []).append(digest)
+
+    def _get_signature(self, digest):
+        signature = self.signatures.get(digest)
+        if signature is None:
+            try:
+                signature = compute_signature(self.images[digest]['path'])
+            except OSError:
+                return None
+            self.signatures[digest] = signature
+        return signature
+
+    def _find_similar(self, dhash, signature):
+        """
+        查找与新图片是同一张图片的已有图片
+
+        参数:
+        dhash -- 新图片的64位感知哈希
+        signature -- 新图片的compute_signature()结果
+
+        返回:
+        已有图片的内容摘要，没有确认相同的图片时返回None
+        """
+        candidates = {}
+        for band in hash_bands(dhash):
+            for digest in self.bands.get(band, []):
+                distance = bin(dhash ^ int(self.images[digest]['dhash'], 16)).count('1')
+                if distance <= MAX_HAMMING_DISTANCE:
+                    candidates[digest] = distance
+        # 按汉明距离从近到远逐个确认；候选很少，读取已有副本的开销可以忽略
+        for digest in sorted(candidates, key=candidates.get):
+            other = self._get_signature(digest)
+            if other is not None and is_same_image(signature, other):
+                return digest
+        return None
+
+    def add(self, image_path, digest=None, alias=True, near_duplicates=True):
+        """
+        将图片加入图片库；已有相同或经确认几乎相同的图片时复用其规范副本
+
+        参数:
+        image_path -- 图片路径
+        digest -- 图片内容摘要，已经算过时可以传入以免重复读文件
+        alias -- 是否记录原始路径到副本的映射，图片来自临时文件时不需要
+        near_duplicates -- 是否合并几乎相同的图片；为False时只合并内容完全相同的图片，
+                           该图片也不会作为其他图片的合并对象
+
+        返回:
+        规范副本的路径
+        """
+        if digest is None:
+            digest = file_digest(image_path)
+        # 哈希计算在锁外进行，多线程导入时只有查表和复制需要串行
+        dhash = signature = None
+        if near_duplicates and digest not in self.images:
+            signature = compute_signature(image_path)
+            if signature is not None and max(signature[2]) - min(signature[2]) >= MIN_CONTRAST:
+                dhash = compute_dhash(image_path)
+
+        with self.lock:
+            if digest not in self.images:
+                similar = self._find_similar(dhash, signature) if dhash is not None else None
+                if similar is not None:
+                    width, height, _ = signature
+                    other_width, other_height, _ = self.signatures[similar]
+                    if width * height > other_width * other_height:
+                        self._upgrade_copy(similar, image_path, digest, dhash, signature)
+                    digest = similar
+                else:
+                    self.images[digest] = {
+                        'path': self._copy_image(image_path, digest),
+                        'dhash': f'{dhash:016x}' if dhash is not None else None,
+                    }
+                    if dhash is not None:
+                        self._index_dhash(digest, dhash)
+                        self.signatures[digest] = signature
+            if alias:
+                self.aliases[os.path.normpath(image_path)] = digest
+            return self.images[digest]['path']
+
+    def _copy_image(self, image_path, digest):
+        ext = os.path.splitext(image_path)[1].lower() or '.jpg'
+        stored_path = os.path.join(self.store_dir, 'images', digest[:2], digest + ext)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        if not os.path.exists(stored_path):
+            shutil.copyfile(image_path, stored_path)
+        return stored_path
+
+    def _upgrade_copy(self, canonical_digest, image_path, digest, dhash, signature):
+        """
+        用分辨率更高的同一张图片替换规范副本
+
+        旧副本留在磁盘上并记为别名，已经直接引用旧副本路径的错题本通过resolve()也会换成新副本。
+
+        参数:
+        canonical_digest -- 规范副本在索引中的内容摘要
+        image_path -- 分辨率更高的图片路径
+        digest -- 该图片的内容摘要
+        dhash -- 该图片的感知哈希
+        signature -- 该图片的compute_signature()结果
+        """
+        image = self.images[canonical_digest]
+        self.aliases[os.path.normpath(image['path'])] = canonical_digest
+        image['path'] = self._copy_image(image_path, digest)
+        image['dhash'] = f'{dhash:016x}'
+        self._index_dhash(canonical_digest, dhash)
+        self.signatures[canonical_digest] = signature
+
+    def resolve(self, image_path):
+        """
+        将原始图片路径换成图片库中规范副本的路径
+
+        参数:
+        image_path -- 原始图片路径
+
+        返回:
+        规范副本的路径；未加入图片库的路径原样返回
+        """
+        if not image_path:
+            return image_path
+        digest = self.aliases.get(os.path.normpath(image_path))
+        if digest is None:
+            return image_path
+        return self.images[digest]['path']
+
+    def save(self):
+        """将索引写回磁盘，先写临时文件再改名以保证原子性"""
+        with self.lock:
+            index = {'images': self.images, 'aliases': self.aliases}
+            os.makedirs(self.store_dir, exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.index_path)
+
+
+def open_default_store():
+    """
+    打开工作目录下的共享图片库，各生成器的main()用它决定是否通过图片库解析图片路径
+
+    返回:
+    ImageStore实例；尚未建立图片库（没有索引文件）时返回None
+    """
+    if not os.path.exists(os.path.join(STORE_DIR, INDEX_FILE)):
+        return None
+    return ImageStore()
+
+
+def import_student_data(json_file_path, store):
+    """
+    将一个学生错题本中的题目图片和标准答案图片加入图片库
+
+    学生答案图片每人不同，不放入共享图片库。
+    标准答案截图常常只差一个选项字母，只合并内容完全相同的。
+
+    参数:
+    json_file_path -- 学生错题本JSON文件路径
+    store -- ImageStore实例
+
+    返回:
+    加入图片库的图片数量
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    count = 0
+    for question in data.get('questions', []):
+        for key in ('question_image_path', 'std_answer_image_path'):
+            image_path = question.get(key, '')
+            if image_path and os.path.isfile(image_path):
+                store.add(image_path, near_duplicates=key == 'question_image_path')
+                count += 1
+    return count
+
+
+def main():
+    # 用法: python image_store.py 学生1.json 学生2.json ...
+    json_files = sys.argv[1:] or ['data.json']
+    store = ImageStore()
+    total = 0
+    for json_file in json_files:
+        total += import_student_data(json_file, store)
+    store.save()
+    print(f"已导入图片：{total} 张，去重后保留：{len(store.images)} 张")
+    print(f"图片库索引：{store.index_path}")
+
+if __name__ == "__main__":
+    main()
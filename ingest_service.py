@@ -0,0 +1,438 @@
+"""
+错题录入服务
+
+接收新的错题记录和图片，分配题号、保存图片、原子地追加到学生的错题本JSON，
+然后合并短时间内的多次提交，只重新渲染该学生有改动的考试部分。
+
+目录约定（均相对于工作目录，与data.json中的图片路径一致）:
+data/<学号>.json              -- 学生错题本
+figs/<学号>/                  -- 学生答案图片
+store/                        -- 全校共享图片库，存放题目和标准答案图片
+<学号>_mistake_notebook.html  -- 生成的错题本
+
+HTTP接口:
+POST /students/<学号>/questions
+{
+    "name": "学生姓名，错题本不存在时使用",
+    "question": {"exam_name": "...", "error_reason": "...", "knowledge_points": [...], ...},
+    "images": {
+        "question_image": {"filename": "q.jpg", "data": "<base64>"},
+        "student_answer_image": {...},
+        "std_answer_image": {...}
+    }
+}
+返回202表示已接收；队列已满时返回503并带Retry-After，调用方稍后重试。
+"""
+import base64
+import json
+import os
+import queue
+import re
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from image_store import ImageStore
+from question_model import IMAGE_PATH_FIELDS, Question, parse_notebook
+from thumbnails import file_digest, build_thumbnails
+from mistake_notebook_generator_v2 import (MIME_TYPES, collect_image_paths, group_questions_by_exam,
+                                           render_exam_section, render_page_footer, render_page_header)
+
+DATA_DIR = 'data'
+FIGS_DIR = 'figs'
+NOTEBOOK_FILE = '{student_id}_mistake_notebook.html'
+
+# 等待处理的提交数上限，超过后拒绝新的提交（背压）
+QUEUE_SIZE = 64
+WORKERS = 4
+# 同一学生在该时间（秒）内的多次提交合并为一次重新渲染
+RENDER_DELAY = 2.0
+# 同时渲染的学生数和每次渲染生成缩略图的线程数；考试结束后大量学生同时提交时，渲染也不会无限制地占用线程
+RENDER_WORKERS = 2
+THUMBNAIL_WORKERS = 4
+# 图片库索引在该时间（秒）内的多次改动合并为一次写盘
+SAVE_DELAY = 5.0
+MAX_BODY_SIZE = 20 * 1024 * 1024
+
+# 请求中的图片字段 -> 错题记录中的图片路径字段
+IMAGE_FIELDS = {
+    'question_image': 'question_image_path',
+    'student_answer_image': 'student_answer_image_path',
+    'std_answer_image': 'std_answer_image_path',
+}
+# 放入共享图片库的图片，学生答案每人不同不放入
+SHARED_IMAGE_FIELDS = ('question_image', 'std_answer_image')
+# 允许上传的图片扩展名；SVG可以包含脚本，不接受
+UPLOAD_EXTENSIONS = frozenset(ext for ext in MIME_TYPES if ext != '.svg')
+DEFAULT_EXTENSION = '.jpg'
+
+
+class QueueFullError(Exception):
+    """提交队列已满，调用方应稍后重试"""
+
+
+def write_json_atomic(json_file_path, data):
+    """
+    先写临时文件再改名，读者不会看到写了一半的JSON
+
+    参数:
+    json_file_path -- JSON文件路径
+    data -- 要写入的数据
+    """
+    tmp_path = f"{json_file_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, json_file_path)
+
+
+def upload_extension(filename):
+    """取上传文件名的扩展名（小写），没有扩展名时按JPEG处理"""
+    return os.path.splitext(filename)[1].lower() or DEFAULT_EXTENSION
+
+
+class StudentLocks:
+    """每个学生一把锁，保证同一学生的错题本读写互斥，不同学生互不阻塞"""
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, student_id):
+        with self.lock:
+            return self.locks.setdefault(student_id, threading.Lock())
+
+
+class NotebookRenderer:
+    """
+    按学生缓存各考试部分的HTML，只重新渲染有改动的考试
+
+    schedule()记录需要更新的考试，同一学生在RENDER_DELAY秒内的多次调用只触发一次渲染；
+    到期的渲染交给固定大小的线程池执行。
+    """
+
+    def __init__(self, student_locks, embed_images=False, responsive_images=True, render_delay=RENDER_DELAY,
+                 render_workers=RENDER_WORKERS):
+        self.student_locks = student_locks
+        self.embed_images = embed_images
+        self.responsive_images = responsive_images
+        self.render_delay = render_delay
+        self.render_locks = StudentLocks()
+        self.pool = ThreadPoolExecutor(max_workers=render_workers)
+        self.sections = {}  # 学号 -> {考试名称: HTML}
+        self.dirty = {}     # 学号 -> 待更新的考试名称集合
+        self.timers = {}    # 学号 -> 等待中的threading.Timer
+        self.lock = threading.Lock()
+
+    def schedule(self, student_id, exam_name):
+        """
+        记录某学生的某场考试需要重新渲染
+
+        参数:
+        student_id -- 学号
+        exam_name -- 考试名称
+        """
+        with self.lock:
+            self.dirty.setdefault(student_id, set()).add(exam_name)
+            if student_id not in self.timers:
+                timer = threading.Timer(self.render_delay, self.pool.submit, args=(self.render, student_id))
+                timer.daemon = True
+                self.timers[student_id] = timer
+                timer.start()
+
+    def flush(self):
+        """立即渲染所有等待中的学生，并等待线程池中的渲染完成，服务退出前调用"""
+        with self.lock:
+            timers, self.timers = self.timers, {}
+        for student_id, timer in timers.items():
+            timer.cancel()
+            self.pool.submit(self.render, student_id)
+        self.pool.shutdown(wait=True)
+
+    def render(self, student_id):
+        """
+        重新渲染一个学生的错题本：只渲染有改动的考试，其余考试使用缓存
+
+        参数:
+        student_id -- 学号
+        """
+        # 同一学生的渲染串行执行，避免较早的渲染覆盖较新的结果
+        with self.render_locks.get(student_id):
+            self.render_sections(student_id)
+
+    def render_sections(self, student_id):
+        with self.lock:
+            self.timers.pop(student_id, None)
+            dirty = self.dirty.pop(student_id, set())
+            cached = self.sections.get(student_id)
+
+        json_file_path = os.path.join(DATA_DIR, f"{student_id}.json")
+        with self.student_locks.get(student_id):
+            with open(json_file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+        try:
+            notebook = parse_notebook(data, source=json_file_path)
+            sections = {}
+            for exam_name, exam_questions in group_questions_by_exam(notebook.questions):
+                if cached is not None and exam_name not in dirty and exam_name in cached:
+                    sections[exam_name] = cached[exam_name]
+                    continue
+                thumbnails = (build_thumbnails(collect_image_paths(exam_questions), max_workers=THUMBNAIL_WORKERS)
+                              if self.responsive_images else {})
+                sections[exam_name] = render_exam_section(exam_name, exam_questions, self.embed_images, thumbnails)
+
+            html_content = render_page_header(notebook.student_id or student_id, notebook.name)
+            html_content += ''.join(sections.values())
+            html_content += render_page_footer()
+
+            output_html_path = NOTEBOOK_FILE.format(student_id=student_id)
+            tmp_path = f"{output_html_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            os.replace(tmp_path, output_html_path)
+        except Exception as e:
+            # 渲染失败时放回待更新集合，下一次提交会再次尝试
+            print(f"渲染错题本时出错 ({student_id}): {e}")
+            with self.lock:
+                self.dirty.setdefault(student_id, set()).update(dirty)
+            return
+
+        with self.lock:
+            self.sections[student_id] = sections
+        print(f"错题本已更新：{output_html_path}（重新渲染 {len(dirty) if cached is not None else len(sections)} 个考试）")
+
+
+class IngestService:
+    """
+    错题录入服务：有界队列加固定数量的工作线程
+
+    submit()立即返回Future，队列已满时抛出QueueFullError；
+    工作线程处理完成后Future的结果为分配的题号。
+    """
+
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, render_delay=RENDER_DELAY,
+                 embed_images=False, responsive_images=True, image_store=None, save_delay=SAVE_DELAY):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.image_store = image_store if image_store is not None else ImageStore()
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.save_lock = threading.Lock()
+        self.student_locks = StudentLocks()
+        self.renderer = NotebookRenderer(self.student_locks, embed_images, responsive_images, render_delay)
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        os.makedirs(DATA_DIR, exist_ok=True)
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, student_id, question, images=None, name=''):
+        """
+        提交一道新错题
+
+        参数:
+        student_id -- 学号
+        question -- 错题记录，question_id和created_at由服务填写；不能包含图片路径，图片通过images上传
+        images -- {图片字段: (文件名, 图片数据)}，图片字段见IMAGE_FIELDS
+        name -- 学生姓名，错题本不存在时使用
+
+        返回:
+        Future，结果为分配的题号
+        """
+        if not re.fullmatch(r'[\w-]+', student_id):
+            raise ValueError(f"无效的学号: {student_id}")
+        if not isinstance(question, dict) or not question.get('exam_name'):
+            raise ValueError("错题记录缺少exam_name")
+        # 图片路径只能由save_image()填写，否则客户端可以让错题本引用服务器上的任意文件
+        path_fields = set(question) & set(IMAGE_PATH_FIELDS)
+        if path_fields:
+            raise ValueError(f"错题记录不能包含图片路径: {', '.join(sorted(path_fields))}")
+        # 格式错误的记录在提交时就拒绝，不会写入错题本后在渲染时才失败
+        Question.from_dict(question)
+        unknown = set(images or {}) - set(IMAGE_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的图片字段: {', '.join(sorted(unknown))}")
+        for field, (filename, image_data) in (images or {}).items():
+            if upload_extension(filename) not in UPLOAD_EXTENSIONS:
+                raise ValueError(f"{field}的文件类型不受支持: {filename}")
+
+        future = Future()
+        try:
+            self.queue.put_nowait((student_id, question, images or {}, name, future))
+        except queue.Full:
+            raise QueueFullError("提交队列已满")
+        return future
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            student_id, question, images, name, future = job
+            try:
+                future.set_result(self.ingest(student_id, question, images, name))
+            except Exception as e:
+                print(f"录入错题时出错 ({student_id}): {e}")
+                future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    def save_image(self, student_id, field, filename, image_data):
+        """
+        保存一张图片：题目和标准答案放入共享图片库，学生答案放入学生自己的目录
+
+        返回:
+        图片路径
+        """
+        ext = upload_extension(filename)
+        student_dir = os.path.join(FIGS_DIR, student_id)
+        os.makedirs(student_dir, exist_ok=True)
+        tmp_path = os.path.join(student_dir, f".upload.{threading.get_ident()}{ext}")
+        with open(tmp_path, 'wb') as f:
+            f.write(image_data)
+
+        digest = file_digest(tmp_path)
+        if field in SHARED_IMAGE_FIELDS:
+            try:
+                # 标准答案截图只合并内容完全相同的，见image_store.import_student_data
+                return self.image_store.add(tmp_path, digest, alias=False,
+                                            near_duplicates=field != 'std_answer_image')
+            finally:
+                os.remove(tmp_path)
+
+        image_path = os.path.join(student_dir, digest + ext)
+        os.replace(tmp_path, image_path)
+        return image_path
+
+    def ingest(self, student_id, question, images, name):
+        """
+        处理一条提交：保存图片、分配题号、追加到错题本并安排重新渲染
+
+        返回:
+        分配的题号
+        """
+        record = {key: value for key, value in question.items() if key not in IMAGE_PATH_FIELDS}
+        for field, (filename, image_data) in images.items():
+            record[IMAGE_FIELDS[field]] = self.save_image(student_id, field, filename, image_data)
+        if any(field in SHARED_IMAGE_FIELDS for field in images):
+            self.schedule_save()
+
+        json_file_path = os.path.join(DATA_DIR, f"{student_id}.json")
+        with self.student_locks.get(student_id):
+            if os.path.exists(json_file_path):
+                with open(json_file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            else:
+                data = {"student_id": student_id, "name": name, "questions": []}
+
+            questions = data.setdefault('questions', [])
+            question_ids = [int(q['question_id']) for q in questions if str(q.get('question_id', '')).isdigit()]
+            record['question_id'] = str(max(question_ids, default=-1) + 1)
+            record['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            record.setdefault('knowledge_points', [])
+            record.setdefault('review_count', 0)
+            record.setdefault('exam_score', None)
+            record.setdefault('last_reviewed_at', None)
+            questions.append(record)
+            write_json_atomic(json_file_path, data)
+
+        self.renderer.schedule(student_id, record['exam_name'])
+        return record['question_id']
+
+    def schedule_save(self):
+        """
+        安排写回图片库索引，SAVE_DELAY秒内的多次调用只写一次
+
+        索引每次都完整写出，逐条提交写盘会限制吞吐量。图片副本在add()时已经写入，
+        错题本引用的是副本路径，索引晚几秒写出不影响已生成的错题本。
+        """
+        with self.save_lock:
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self.save_store)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def save_store(self):
+        with self.save_lock:
+            self.save_timer = None
+        try:
+            self.image_store.save()
+        except Exception as e:
+            print(f"保存图片库索引时出错: {e}")
+
+    def close(self):
+        """处理完队列中剩余的提交，停止工作线程，渲染所有等待中的错题本并写回图片库索引"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.renderer.flush()
+        with self.save_lock:
+            timer, self.save_timer = self.save_timer, None
+        if timer is not None:
+            timer.cancel()
+        self.image_store.save()
+
+
+class IngestRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        match = re.fullmatch(r'/students/([\w-]+)/questions', self.path)
+        if not match:
+            self.send_json(404, {"error": "未知的路径"})
+            return
+
+        # Content-Length不是数字或为负数时拒绝，负数会让rfile.read()一直读到客户端断开
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "Content-Length无效"})
+            return
+        if length > MAX_BODY_SIZE:
+            self.send_json(413, {"error": "请求过大"})
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length))
+            images = {field: (image.get('filename', ''), base64.b64decode(image['data']))
+                      for field, image in payload.get('images', {}).items()}
+            self.service.submit(match.group(1), payload.get('question'), images, payload.get('name', ''))
+        except QueueFullError as e:
+            self.send_json(503, {"error": str(e)}, {'Retry-After': '1'})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": f"请求格式错误: {e}"})
+        else:
+            self.send_json(202, {"status": "accepted"})
+
+
+def main():
+    # 用法: python ingest_service.py [端口]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    service = IngestService()
+    IngestRequestHandler.service = service
+    server = ThreadingHTTPServer(('127.0.0.1', port), IngestRequestHandler)
+    print(f"错题录入服务已启动：http://127.0.0.1:{port}/students/<学号>/questions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print("错题录入服务已停止")
+
+if __name__ == "__main__":
+    main()
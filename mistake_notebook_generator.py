@@ -2,22 +2,25 @@ import json
 import os
 from datetime import datetime
 
-def generate_mistake_notebook_html(json_file_path, output_html_path):
+from image_store import open_default_store
+from question_model import load_notebook
+
+def generate_mistake_notebook_html(json_file_path, output_html_path, image_store=None):
     """
     将JSON格式的错题本数据渲染为简约好看的HTML格式文件
     
     参数:
     json_file_path -- JSON文件路径
     output_html_path -- 输出HTML文件路径
+    image_store -- 共享图片库ImageStore，可以为None，传给load_notebook()
     """
-    # 读取JSON文件
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # 读取并校验JSON文件，题目和标准答案图片换成共享图片库中的规范副本
+    notebook = load_notebook(json_file_path, image_store)
     
     # 提取学生信息
-    student_id = data.get('student_id', '')
-    student_name = data.get('name', '')
-    questions = data.get('questions', [])
+    student_id = notebook.student_id
+    student_name = notebook.name
+    questions = notebook.questions
     
     # 生成HTML内容
     html_content = f"""<!DOCTYPE html>
@@ -176,7 +179,7 @@ def generate_mistake_notebook_html(json_file_path, output_html_path):
     # 按考试名称分组
     exam_groups = {}
     for question in questions:
-        exam_name = question.get('exam_name', '未分类')
+        exam_name = question.exam_name
         if exam_name not in exam_groups:
             exam_groups[exam_name] = []
         exam_groups[exam_name].append(question)
@@ -204,18 +207,18 @@ def generate_mistake_notebook_html(json_file_path, output_html_path):
         
         # 遍历该考试的所有题目
         for question in exam_questions:
-            question_id = question.get('question_id', '')
-            error_reason = question.get('error_reason', '')
-            knowledge_points = question.get('knowledge_points', [])
-            review_count = question.get('review_count', 0)
-            created_at = question.get('created_at', '')
-            last_reviewed_at = question.get('last_reviewed_at', '尚未复习')
+            question_id = question.question_id
+            error_reason = question.error_reason
+            knowledge_points = question.knowledge_points
+            review_count = question.review_count
+            created_at = question.created_at_text
+            last_reviewed_at = question.last_reviewed_at_text
             
             # 题目图片路径
-            question_image = question.get('question_image_path', '')
-            student_answer_image = question.get('student_answer_image_path', '')
-            student_answer_text = question.get('student_answer_text', '')
-            std_answer_image = question.get('std_answer_image_path', '')
+            question_image = question.question_image_path
+            student_answer_image = question.student_answer_image_path
+            student_answer_text = question.student_answer_text
+            std_answer_image = question.std_answer_image_path
             
             html_content += f"""
                 <div class="question-card">
@@ -269,15 +272,14 @@ def generate_mistake_notebook_html(json_file_path, output_html_path):
                             </div>
 """
             
-            # 知识点标签
-            if any(knowledge_points):
+            # 知识点标签（加载时已去掉空的知识点）
+            if knowledge_points:
                 html_content += """
                             <div class="knowledge-points">
                                 <h3>知识点:</h3>
 """
                 for kp in knowledge_points:
-                    if kp:  # 只添加非空的知识点
-                        html_content += f"""
+                    html_content += f"""
                                 <span class="knowledge-tag">{kp}</span>
 """
                 html_content += """
@@ -369,8 +371,10 @@ def main():
         with open(json_file, 'w', encoding='utf-8') as f:
             json.dump(example_data, f, ensure_ascii=False, indent=4)
     
+    image_store = open_default_store()
+    
     # 生成HTML错题本
-    generated_html = generate_mistake_notebook_html(json_file, output_html)
+    generated_html = generate_mistake_notebook_html(json_file, output_html, image_store)
     print(f"错题本已生成：{generated_html}")
 
 if __name__ == "__main__":
@@ -1,9 +1,25 @@
 import json
 import os
 import base64
+import html
 from datetime import datetime
 
-def generate_mistake_notebook_html(json_file_path, output_html_path, embed_images=False):
+from image_store import open_default_store
+from question_model import load_notebook
+from thumbnails import THUMBNAIL_SIZES, build_thumbnails
+
+# 图片扩展名 -> MIME类型
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+    '.svg': 'image/svg+xml'
+}
+
+def generate_mistake_notebook_html(json_file_path, output_html_path, embed_images=False, responsive_images=False, image_store=None):
     """
     将JSON格式的错题本数据渲染为简约好看的HTML格式文件
     
@@ -11,18 +27,56 @@ def generate_mistake_notebook_html(json_file_path, output_html_path, embed_image
     json_file_path -- JSON文件路径
     output_html_path -- 输出HTML文件路径
     embed_images -- 是否将图片嵌入到HTML中，默认为False
+    responsive_images -- 是否先显示缩略图、点击后再加载原图，默认为False；
+                         与embed_images同时使用时只嵌入缩略图，原图仍按路径加载，单独拿走HTML文件就看不到原图
+    image_store -- 共享图片库ImageStore，可以为None，传给load_notebook()
     """
-    # 读取JSON文件
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # 读取并校验JSON文件，题目和标准答案图片换成共享图片库中的规范副本
+    notebook = load_notebook(json_file_path, image_store)
     
     # 提取学生信息
-    student_id = data.get('student_id', '')
-    student_name = data.get('name', '')
-    questions = data.get('questions', [])
+    student_id = notebook.student_id
+    student_name = notebook.name
+    questions = notebook.questions
+    
+    # 预先并行生成所有图片的缩略图
+    thumbnails = build_thumbnails(collect_image_paths(questions)) if responsive_images else {}
     
     # 生成HTML内容
-    html_content = f"""<!DOCTYPE html>
+    html_content = render_page_header(student_id, student_name)
+    
+    # 遍历每个考试组
+    for exam_name, exam_questions in group_questions_by_exam(questions):
+        html_content += render_exam_section(exam_name, exam_questions, embed_images, thumbnails)
+    
+    # 添加页脚
+    html_content += render_page_footer()
+    
+    # 保存HTML文件
+    with open(output_html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    
+    return output_html_path
+
+def render_page_header(student_id, student_name, generated_at=None):
+    """
+    生成页面开头：样式表和学生信息
+    
+    参数:
+    student_id -- 学号
+    student_name -- 学生姓名
+    generated_at -- 显示的生成时间（可以是HTML），默认为当前时间
+    
+    返回:
+    HTML字符串
+    """
+    if generated_at is None:
+        generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # 姓名、学号等文字可能来自录入服务的提交，转义后再放进页面
+    student_id = html.escape(str(student_id))
+    student_name = html.escape(student_name)
+    
+    return f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
@@ -164,6 +218,29 @@ def generate_mistake_notebook_html(json_file_path, output_html_path, embed_image
             margin-bottom: 8px;
             color: #333;
         }}
+        .image-container img.expandable {{
+            cursor: zoom-in;
+        }}
+        .image-viewer {{
+            display: none;
+            position: fixed;
+            top: 0;
+            left: 0;
+            right: 0;
+            bottom: 0;
+            background-color: rgba(0, 0, 0, 0.85);
+            overflow: auto;
+            cursor: zoom-out;
+            z-index: 100;
+        }}
+        .image-viewer.active {{
+            display: block;
+        }}
+        .image-viewer img {{
+            display: block;
+            max-width: 100%;
+            margin: 0 auto;
+        }}
     </style>
 </head>
 <body>
@@ -172,54 +249,77 @@ def generate_mistake_notebook_html(json_file_path, output_html_path, embed_image
             <h1>{student_name}的错题本</h1>
             <div class="student-info">
                 <p>学号: {student_id}</p>
-                <p>生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+                <p>生成时间: {generated_at}</p>
             </div>
         </header>
         
         <div class="questions-container">
 """
+
+def render_exam_section(exam_name, exam_questions, embed_images=False, thumbnails=None):
+    """
+    生成一场考试的标题和所有题目卡片
     
-    # 按考试分组
-    exam_groups = {}
-    for question in questions:
-        exam_name = question.get('exam_name', '未分类')
-        if exam_name not in exam_groups:
-            exam_groups[exam_name] = []
-        exam_groups[exam_name].append(question)
-    
-    # 按考试名称排序
-    sorted_exam_names = sorted(exam_groups.keys())
+    参数:
+    exam_name -- 考试名称
+    exam_questions -- 该考试的Question列表
+    embed_images -- 是否嵌入图片
+    thumbnails -- {原图路径: 缩略图列表}，为空时直接使用原图
     
-    # 遍历每个考试组
-    for exam_name in sorted_exam_names:
-        exam_questions = exam_groups[exam_name]
-        
-        # 添加考试标题
-        html_content += f"""
-            <div class="section-header">{exam_name}</div>
+    返回:
+    HTML字符串
+    """
+    # 添加考试标题
+    section_html = f"""
+            <div class="section-header">{html.escape(exam_name)}</div>
 """
-        
-        # 遍历该考试的所有题目
-        for question in exam_questions:
-            question_id = question.get('question_id', '')
-            error_reason = question.get('error_reason', '')
-            knowledge_points = question.get('knowledge_points', [])
-            review_count = question.get('review_count', 0)
-            created_at = question.get('created_at', '')
-            last_reviewed_at = question.get('last_reviewed_at', '尚未复习')
-            
-            # 题目图片路径
-            question_image_path = question.get('question_image_path', '')
-            student_answer_image_path = question.get('student_answer_image_path', '')
-            student_answer_text = question.get('student_answer_text', '')
-            std_answer_image_path = question.get('std_answer_image_path', '')
-            
-            # 处理图片嵌入
-            question_image_tag = get_image_tag(question_image_path, "题目图片", embed_images)
-            student_answer_image_tag = get_image_tag(student_answer_image_path, "我的答案", embed_images)
-            std_answer_image_tag = get_image_tag(std_answer_image_path, "标准答案", embed_images)
-            
-            html_content += f"""
+    
+    # 遍历该考试的所有题目
+    for question in exam_questions:
+        section_html += render_question_card(exam_name, question, embed_images, thumbnails)
+    
+    return section_html
+
+def render_question_card(exam_name, question, embed_images=False, thumbnails=None, image_tag=None):
+    """
+    生成一道题目的卡片
+    
+    参数:
+    exam_name -- 考试名称
+    question -- Question实例
+    embed_images -- 是否嵌入图片
+    thumbnails -- {原图路径: 缩略图列表}，为空时直接使用原图
+    image_tag -- 自定义img标签的函数 image_tag(图片路径, 替代文本)，为空时使用get_image_tag
+    
+    返回:
+    HTML字符串
+    """
+    thumbnails = thumbnails or {}
+    if image_tag is None:
+        def image_tag(image_path, alt_text):
+            return get_image_tag(image_path, alt_text, embed_images, thumbnails.get(image_path))
+    
+    # 文字字段可能来自录入服务的提交，转义后再放进页面
+    exam_name = html.escape(exam_name)
+    question_id = html.escape(question.question_id)
+    error_reason = html.escape(question.error_reason)
+    knowledge_points = [html.escape(kp) for kp in question.knowledge_points]
+    review_count = question.review_count
+    created_at = html.escape(question.created_at_text)
+    last_reviewed_at = html.escape(question.last_reviewed_at_text)
+    
+    # 题目图片路径
+    question_image_path = question.question_image_path
+    student_answer_image_path = question.student_answer_image_path
+    student_answer_text = html.escape(question.student_answer_text)
+    std_answer_image_path = question.std_answer_image_path
+    
+    # 处理图片嵌入
+    question_image_tag = image_tag(question_image_path, "题目图片")
+    student_answer_image_tag = image_tag(student_answer_image_path, "我的答案") if student_answer_image_path else ''
+    std_answer_image_tag = image_tag(std_answer_image_path, "标准答案")
+    
+    card_html = f"""
                 <div class="question-card">
                     <div class="question-header">
                         <div>
@@ -243,75 +343,136 @@ def generate_mistake_notebook_html(json_file_path, output_html_path, embed_image
                         <div class="answer-content">
                             <h3>我的答案</h3>
 """
-            
-            # 根据是否有学生答案图片来决定显示图片还是文本
-            if student_answer_image_path:
-                html_content += f"""
+    
+    # 根据是否有学生答案图片来决定显示图片还是文本
+    if student_answer_image_path:
+        card_html += f"""
                             <div class="image-container">
                                 {student_answer_image_tag}
                             </div>
 """
-            elif student_answer_text:
-                html_content += f"""
+    elif student_answer_text:
+        card_html += f"""
                             <p>{student_answer_text}</p>
 """
-            
-            html_content += f"""
+    
+    card_html += f"""
                             <h3>标准答案</h3>
                             <div class="image-container">
                                 {std_answer_image_tag}
                             </div>
 """
-            
-            # 错误原因
-            if error_reason:
-                html_content += f"""
+    
+    # 错误原因
+    if error_reason:
+        card_html += f"""
                             <div class="error-reason">
                                 <h3>错误原因</h3>
                                 <p>{error_reason}</p>
                             </div>
 """
-            
-            # 知识点标签
-            if any(knowledge_points):
-                html_content += """
+    
+    # 知识点标签（加载时已去掉空的知识点）
+    if knowledge_points:
+        card_html += """
                             <div class="knowledge-points">
                                 <h3>知识点:</h3>
 """
-                for kp in knowledge_points:
-                    if kp:  # 只添加非空的知识点
-                        html_content += f"""
+        for kp in knowledge_points:
+            card_html += f"""
                                 <span class="knowledge-tag">{kp}</span>
 """
-                html_content += """
+        card_html += """
                             </div>
 """
-            
-            html_content += """
+    
+    card_html += """
                         </div>
                     </div>
                 </div>
 """
     
-    # 添加页脚
-    html_content += """
+    return card_html
+
+def render_page_footer(extra_html=''):
+    """
+    生成页脚和查看原图的脚本
+    
+    参数:
+    extra_html -- 插入到</body>之前的额外内容，如脚本
+    
+    返回:
+    HTML字符串
+    """
+    return """
         </div>
         
         <div class="footer">
             <p>错题本 - 学习进步的阶梯</p>
         </div>
     </div>
-</body>
+    
+    <div id="image-viewer" class="image-viewer" onclick="closeImage()">
+        <img alt="原图">
+    </div>
+
+    <script>
+        function expandImage(img) {
+            // 点击缩略图时才加载原图，原图加载失败时退回缩略图
+            const viewerImage = document.querySelector('#image-viewer img');
+            viewerImage.onerror = function() {
+                this.onerror = null;
+                this.src = img.currentSrc || img.src;
+            };
+            viewerImage.src = img.dataset.full;
+            document.getElementById('image-viewer').classList.add('active');
+        }
+
+        function closeImage() {
+            document.getElementById('image-viewer').classList.remove('active');
+        }
+    </script>
+""" + extra_html + """</body>
 </html>
 """
+
+def collect_image_paths(questions):
+    """
+    收集题目中用到的所有图片路径
     
-    # 保存HTML文件
-    with open(output_html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    参数:
+    questions -- Question列表
     
-    return output_html_path
+    返回:
+    图片路径列表，可能包含空路径
+    """
+    image_paths = []
+    for question in questions:
+        image_paths.append(question.question_image_path)
+        image_paths.append(question.student_answer_image_path)
+        image_paths.append(question.std_answer_image_path)
+    return image_paths
 
-def get_image_tag(image_path, alt_text, embed_images=False):
+def group_questions_by_exam(questions):
+    """
+    按考试名称分组并排序
+    
+    参数:
+    questions -- Question列表
+    
+    返回:
+    [(考试名称, 该考试的题目列表), ...]，按考试名称排序
+    """
+    exam_groups = {}
+    for question in questions:
+        exam_name = question.exam_name
+        if exam_name not in exam_groups:
+            exam_groups[exam_name] = []
+        exam_groups[exam_name].append(question)
+    
+    return [(exam_name, exam_groups[exam_name]) for exam_name in sorted(exam_groups.keys())]
+
+def get_image_tag(image_path, alt_text, embed_images=False, thumbnails=None):
     """
     根据是否嵌入图片生成不同的img标签
     
@@ -319,10 +480,14 @@ def get_image_tag(image_path, alt_text, embed_images=False):
     image_path -- 图片路径
     alt_text -- 替代文本
     embed_images -- 是否嵌入图片
+    thumbnails -- 该图片的缩略图列表 [(宽度, 缩略图路径), ...]，为空时直接使用原图
     
     返回:
     img标签字符串
     """
+    if image_path and thumbnails:
+        return get_thumbnail_image_tag(image_path, alt_text, embed_images, thumbnails)
+    
     if not image_path:
         return f'<img src="data:image/svg+xml;charset=utf-8,%3Csvg xmlns%3D%22http%3A%2F%2Fwww.w3.org%2F2000%2Fsvg%22 viewBox%3D%220 0 300 200%22%3E%3Crect width%3D%22300%22 height%3D%22200%22 fill%3D%22%23f3f3f3%22%3E%3C%2Frect%3E%3Ctext x%3D%22100%22 y%3D%22100%22 font-family%3D%22Arial%22 font-size%3D%2216%22 fill%3D%22%23999%22%3E无图片%3C%2Ftext%3E%3C%2Fsvg%3E" alt="{alt_text}">'
     
@@ -348,6 +513,38 @@ def get_image_tag(image_path, alt_text, embed_images=False):
         # 返回普通图片标签
         return f'<img src="{image_path}" alt="{alt_text}" onerror="this.onerror=null; this.src=\'data:image/svg+xml;charset=utf-8,%3Csvg xmlns%3D%22http%3A%2F%2Fwww.w3.org%2F2000%2Fsvg%22 viewBox%3D%220 0 300 200%22%3E%3Crect width%3D%22300%22 height%3D%22200%22 fill%3D%22%23f3f3f3%22%3E%3C%2Frect%3E%3Ctext x%3D%22100%22 y%3D%22100%22 font-family%3D%22Arial%22 font-size%3D%2216%22 fill%3D%22%23999%22%3E图片未找到%3C%2Ftext%3E%3C%2Fsvg%3E\'">'
 
+def get_thumbnail_image_tag(image_path, alt_text, embed_images, thumbnails):
+    """
+    生成先显示缩略图、点击后才加载原图的img标签
+    
+    参数:
+    image_path -- 原图路径
+    alt_text -- 替代文本
+    embed_images -- 是否嵌入图片，嵌入时只嵌入最大的一档缩略图
+    thumbnails -- 缩略图列表 [(宽度, 缩略图路径), ...]，按宽度升序
+    
+    返回:
+    img标签字符串
+    """
+    expand_attrs = f'class="expandable" data-full="{image_path}" onclick="expandImage(this)"'
+    
+    if embed_images:
+        # 嵌入时srcset中的每一档都会写进HTML，所以只嵌入最大的一档；
+        # 点击查看的原图没有嵌入，HTML文件离开图片目录后只能看到这一档缩略图
+        width, thumbnail_path = thumbnails[-1]
+        try:
+            with open(thumbnail_path, 'rb') as img_file:
+                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+        except Exception as e:
+            print(f"嵌入缩略图时出错 ({thumbnail_path}): {e}")
+            return get_image_tag(image_path, alt_text, embed_images)
+        return f'<img src="data:image/jpeg;base64,{img_data}" alt="{alt_text}" {expand_attrs}>'
+    
+    # srcset只列缩略图：原图一旦作为候选，高分辨率手机首屏就会直接下载原图；原图只在点击时通过data-full加载
+    srcset = ', '.join(f'{thumbnail_path} {width}w' for width, thumbnail_path in thumbnails)
+    smallest_path = thumbnails[0][1]
+    return f'<img src="{smallest_path}" srcset="{srcset}" sizes="{THUMBNAIL_SIZES}" alt="{alt_text}" loading="lazy" {expand_attrs}>'
+
 def get_mime_type(file_path):
     """
     根据文件扩展名获取MIME类型
@@ -359,16 +556,7 @@ def get_mime_type(file_path):
     MIME类型字符串
     """
     ext = os.path.splitext(file_path)[1].lower()
-    mime_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.bmp': 'image/bmp',
-        '.webp': 'image/webp',
-        '.svg': 'image/svg+xml'
-    }
-    return mime_types.get(ext, 'image/jpeg')  # 默认为JPEG
+    return MIME_TYPES.get(ext, 'image/jpeg')  # 默认为JPEG
 
 def main():
     # 示例用法
@@ -418,10 +606,15 @@ def main():
         with open(json_file, 'w', encoding='utf-8') as f:
             json.dump(example_data, f, ensure_ascii=False, indent=4)
     
+    image_store = open_default_store()
+    
     # 生成HTML错题本
     # 设置embed_images=True以嵌入图片，使HTML独立运行
     embed_images = True  # 可以根据需要修改这个参数
-    generated_html = generate_mistake_notebook_html(json_file, output_html, embed_images)
+    # 设置responsive_images=True以先显示缩略图，点击图片后再加载原图；
+    # 缩略图模式下原图不会嵌入，所以嵌入图片时默认关闭，保证独立的HTML文件里是完整分辨率的原图
+    responsive_images = not embed_images
+    generated_html = generate_mistake_notebook_html(json_file, output_html, embed_images, responsive_images, image_store)
     print(f"错题本已生成：{generated_html}")
     print(f"图片嵌入设置：{'已嵌入' if embed_images else '未嵌入'}")
 
@@ -0,0 +1,414 @@
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from image_store import open_default_store
+from mistake_notebook_generator_v2 import group_questions_by_exam
+from question_model import load_notebook
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时只能导出JPEG图片
+    Image = None
+
+# A4纸张，单位为pt(1/72英寸)
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 40
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+CONTENT_HEIGHT = PAGE_HEIGHT - 2 * MARGIN
+# 图片按该分辨率换算打印尺寸，再缩小到不超过版心
+IMAGE_DPI = 150
+CARD_SPACING = 18
+
+TITLE_SIZE = 13
+LABEL_SIZE = 11
+TEXT_SIZE = 10
+LINE_SPACING = 1.5
+
+# PDF阅读器内置的宋体，不需要嵌入字体文件即可显示中文
+FONT_NAME = 'STSong-Light'
+
+
+class PdfImage:
+    """PDF中的一张图片：原始JPEG数据和尺寸"""
+
+    def __init__(self, data, width, height, components):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.components = components
+
+
+def read_jpeg_size(image_path):
+    """
+    只读取JPEG文件头，获取图片尺寸和颜色通道数
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    (宽, 高, 通道数)；不是JPEG文件时返回None
+    """
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xff:
+                return None
+            # SOF0~SOF15中除去DHT(C4)、JPG(C8)、DAC(CC)都是帧头
+            if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+                _, _, height, width, components = struct.unpack('>HBHHB', f.read(8))
+                return width, height, components
+            length = struct.unpack('>H', f.read(2))[0]
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def get_image_size(image_path):
+    """
+    获取图片尺寸，供排版使用
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    (宽, 高)像素；图片不存在或无法识别时返回None
+    """
+    if not image_path or not os.path.isfile(image_path):
+        return None
+    try:
+        size = read_jpeg_size(image_path)
+        if size is not None:
+            return size[:2]
+        if Image is not None:
+            with Image.open(image_path) as image:
+                return image.size
+    except Exception as e:
+        print(f"读取图片尺寸时出错 ({image_path}): {e}")
+    return None
+
+
+def load_pdf_image(image_path):
+    """
+    读取图片数据；JPEG直接使用原始数据，其他格式转换为JPEG
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    PdfImage实例
+    """
+    size = read_jpeg_size(image_path)
+    if size is not None:
+        with open(image_path, 'rb') as f:
+            return PdfImage(f.read(), *size)
+
+    with Image.open(image_path) as image:
+        image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        return PdfImage(buffer.getvalue(), image.width, image.height, 3)
+
+
+def text_width(text, size):
+    """估算文字宽度：中文全角，ASCII半角"""
+    return sum(size if ord(char) > 127 else size * 0.5 for char in text)
+
+
+def wrap_text(text, size, width=CONTENT_WIDTH):
+    """
+    按版心宽度折行
+
+    参数:
+    text -- 文字
+    size -- 字号
+    width -- 可用宽度
+
+    返回:
+    行列表
+    """
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        line, line_width = '', 0
+        for char in paragraph:
+            char_width = text_width(char, size)
+            if line and line_width + char_width > width:
+                lines.append(line)
+                line, line_width = '', 0
+            line += char
+            line_width += char_width
+        lines.append(line)
+    return lines
+
+
+def text_blocks(text, size, kind='text'):
+    """将一段文字转换为逐行的排版块；kind为'label'的小标题不与下一块分页"""
+    return [(kind, size, line, size * LINE_SPACING) for line in wrap_text(text, size)]
+
+
+def image_block(image_path):
+    """
+    将一张图片转换为排版块，按IMAGE_DPI换算尺寸并缩小到版心以内
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    排版块列表；图片缺失时为一行提示文字
+    """
+    size = get_image_size(image_path)
+    if size is None:
+        return text_blocks('（图片未找到）', TEXT_SIZE)
+    width, height = size
+    scale = min(72 / IMAGE_DPI, CONTENT_WIDTH / width, (CONTENT_HEIGHT - 2 * LABEL_SIZE * LINE_SPACING) / height)
+    return [('image', image_path, width * scale, height * scale + 6)]
+
+
+def question_card_blocks(exam_name, question):
+    """
+    将一道错题排成若干不可拆分的排版块：题目、我的答案、标准答案、错误原因
+
+    参数:
+    exam_name -- 考试名称
+    question -- Question实例
+
+    返回:
+    [(类型, ...参数, 高度), ...]
+    """
+    question_id = question.question_id
+    error_reason = question.error_reason
+    knowledge_points = question.knowledge_points
+    student_answer_image_path = question.student_answer_image_path
+    student_answer_text = question.student_answer_text
+
+    blocks = [('rule', 8)]
+    blocks += text_blocks(f"{exam_name}  题号: {question_id}", TITLE_SIZE)
+
+    blocks += text_blocks('题目', LABEL_SIZE, 'label')
+    blocks += image_block(question.question_image_path)
+
+    blocks += text_blocks('我的答案', LABEL_SIZE, 'label')
+    if student_answer_image_path:
+        blocks += image_block(student_answer_image_path)
+    elif student_answer_text:
+        blocks += text_blocks(student_answer_text, TEXT_SIZE)
+
+    blocks += text_blocks('标准答案', LABEL_SIZE, 'label')
+    blocks += image_block(question.std_answer_image_path)
+
+    if error_reason:
+        blocks += text_blocks('错误原因', LABEL_SIZE, 'label')
+        blocks += text_blocks(error_reason, TEXT_SIZE)
+
+    if knowledge_points:
+        blocks += text_blocks('知识点: ' + '、'.join(knowledge_points), TEXT_SIZE)
+    return blocks
+
+
+def layout_pages(cards):
+    """
+    将题目卡片排入固定大小的页面
+
+    一张卡片放得下时不跨页；比整页还高的卡片按块跨页，单个块不拆分。
+
+    参数:
+    cards -- 每张卡片的排版块列表
+
+    返回:
+    页面列表，每页为[(块, 该块顶部距版心顶部的距离), ...]
+    """
+    pages = []
+    page, used = [], 0
+    for blocks in cards:
+        card_height = sum(block[-1] for block in blocks)
+        if page and used + card_height > CONTENT_HEIGHT and card_height <= CONTENT_HEIGHT:
+            pages.append(page)
+            page, used = [], 0
+        for i, block in enumerate(blocks):
+            # 小标题与紧随其后的块放在同一页
+            needed = block[-1]
+            if block[0] == 'label' and i + 1 < len(blocks):
+                needed += blocks[i + 1][-1]
+            if page and used + needed > CONTENT_HEIGHT:
+                pages.append(page)
+                page, used = [], 0
+            page.append((block, used))
+            used += block[-1]
+        used += CARD_SPACING
+    if page:
+        pages.append(page)
+    return pages
+
+
+def encode_text(text):
+    """将文字编码为UniGB-UCS2-H编码的十六进制字符串，超出BMP的字符替换为问号"""
+    return ''.join(f'{ord(char) if ord(char) <= 0xffff else 0x3f:04X}' for char in text)
+
+
+def render_page(page):
+    """
+    生成一页的内容流并读取该页用到的图片，可在线程池中并行执行
+
+    参数:
+    page -- layout_pages()返回的一页
+
+    返回:
+    (压缩后的内容流, [(图片路径, PdfImage), ...])
+    """
+    commands = []
+    images = []
+    for block, top in page:
+        kind = block[0]
+        if kind == 'rule':
+            y = PAGE_HEIGHT - MARGIN - top - block[-1] / 2
+            commands.append(f'0.85 G 0.5 w {MARGIN:.2f} {y:.2f} m {PAGE_WIDTH - MARGIN:.2f} {y:.2f} l S')
+        elif kind in ('text', 'label'):
+            _, size, line, height = block
+            y = PAGE_HEIGHT - MARGIN - top - size
+            commands.append(f'BT /F1 {size} Tf {MARGIN:.2f} {y:.2f} Td <{encode_text(line)}> Tj ET')
+        elif kind == 'image':
+            _, image_path, width, height = block
+            try:
+                image = load_pdf_image(image_path)
+            except Exception as e:
+                print(f"读取图片时出错 ({image_path}): {e}")
+                continue
+            name = f'Im{len(images)}'
+            images.append((image_path, image))
+            x = MARGIN + (CONTENT_WIDTH - width) / 2
+            y = PAGE_HEIGHT - MARGIN - top - height + 3
+            commands.append(f'q {width:.2f} 0 0 {height - 6:.2f} {x:.2f} {y:.2f} cm /{name} Do Q')
+    return zlib.compress('\n'.join(commands).encode('ascii')), images
+
+
+class PdfWriter:
+    """
+    按页流式写出PDF：每页写完即释放，只在内存中保留对象偏移量
+
+    对象1为Catalog，对象2为Pages，对象3~5为字体，其余对象按写出顺序编号。
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.next_id = 6
+        self.page_ids = []
+        self.image_ids = {}  # 图片路径 -> 对象编号，同一张图片只写一次
+        self.f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_fonts()
+
+    def allocate(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f'{object_id} 0 obj\n'.encode('ascii'))
+        self.f.write(body.encode('ascii'))
+        if stream is not None:
+            self.f.write(b'\nstream\n')
+            self.f.write(stream)
+            self.f.write(b'\nendstream')
+        self.f.write(b'\nendobj\n')
+
+    def write_fonts(self):
+        self.write_object(3, f'<< /Type /Font /Subtype /Type0 /BaseFont /{FONT_NAME} /Encoding /UniGB-UCS2-H /DescendantFonts [4 0 R] >>')
+        # ASCII字符对应的CID 1~95按半角宽度显示，与text_width()的估算一致
+        self.write_object(4, f'<< /Type /Font /Subtype /CIDFontType0 /BaseFont /{FONT_NAME} '
+                             '/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> '
+                             '/FontDescriptor 5 0 R /DW 1000 /W [1 95 500] >>')
+        self.write_object(5, f'<< /Type /FontDescriptor /FontName /{FONT_NAME} /Flags 6 /FontBBox [-25 -254 1000 880] '
+                             '/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>')
+
+    def write_image(self, image_path, image):
+        if image_path in self.image_ids:
+            return self.image_ids[image_path]
+        color_space = {1: '/DeviceGray', 4: '/DeviceCMYK'}.get(image.components, '/DeviceRGB')
+        object_id = self.allocate()
+        self.write_object(object_id, f'<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                                     f'/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode '
+                                     f'/Length {len(image.data)} >>', image.data)
+        self.image_ids[image_path] = object_id
+        return object_id
+
+    def write_page(self, content, images):
+        xobjects = ' '.join(f'/Im{i} {self.write_image(path, image)} 0 R' for i, (path, image) in enumerate(images))
+        content_id = self.allocate()
+        self.write_object(content_id, f'<< /Length {len(content)} /Filter /FlateDecode >>', content)
+        page_id = self.allocate()
+        self.write_object(page_id, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                                   f'/Resources << /Font << /F1 3 0 R >> /XObject << {xobjects} >> >> '
+                                   f'/Contents {content_id} 0 R >>')
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self.write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        self.write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self.f.tell()
+        self.f.write(f'xref\n0 {self.next_id}\n0000000000 65535 f \n'.encode('ascii'))
+        for object_id in range(1, self.next_id):
+            self.f.write(f'{self.offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        self.f.write(f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
+
+
+def export_mistake_notebook_pdf(json_file_path, output_pdf_path, image_store=None, max_workers=None):
+    """
+    将错题本导出为便于打印的PDF文件
+
+    参数:
+    json_file_path -- JSON文件路径
+    output_pdf_path -- 输出PDF文件路径
+    image_store -- 共享图片库ImageStore，可以为None，传给load_notebook()
+    max_workers -- 并行渲染页面的线程数，默认由ThreadPoolExecutor决定
+
+    返回:
+    输出PDF文件路径
+    """
+    # 读取并校验JSON文件，题目和标准答案图片换成共享图片库中的规范副本
+    questions = load_notebook(json_file_path, image_store).questions
+
+    # 排版只读取图片文件头，很快；读取图片数据和生成内容流放到线程池
+    cards = [question_card_blocks(exam_name, question)
+             for exam_name, exam_questions in group_questions_by_exam(questions)
+             for question in exam_questions]
+    pages = layout_pages(cards)
+
+    # 与ThreadPoolExecutor的默认线程数一致
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+    with open(output_pdf_path, 'wb') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        writer = PdfWriter(f)
+        # 最多同时保留max_workers * 2页在内存中，按页序写出
+        window = max_workers * 2
+        pending = deque()
+        for page in pages:
+            pending.append(executor.submit(render_page, page))
+            if len(pending) >= window:
+                writer.write_page(*pending.popleft().result())
+        while pending:
+            writer.write_page(*pending.popleft().result())
+        writer.close()
+
+    return output_pdf_path
+
+def main():
+    # 示例用法
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    json_file = os.path.join(script_dir, 'data.json')
+    output_pdf = os.path.join(script_dir, 'mistake_notebook.pdf')
+
+    image_store = open_default_store()
+
+    generated_pdf = export_mistake_notebook_pdf(json_file, output_pdf, image_store)
+    print(f"错题本PDF已生成：{generated_pdf}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import sys
+from datetime import datetime
+
+IMAGE_PATH_FIELDS = ('question_image_path', 'student_answer_image_path', 'std_answer_image_path')
+# 放入共享图片库、需要通过它解析路径的图片
+SHARED_IMAGE_PATH_FIELDS = ('question_image_path', 'std_answer_image_path')
+
+
+def parse_time(value, field):
+    """
+    解析时间字符串
+
+    参数:
+    value -- 时间字符串，可以为空
+    field -- 字段名，用于错误信息
+
+    返回:
+    datetime；为空时返回None
+    """
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field}应为字符串: {value!r}")
+    # data.json中的时间形如2025-03-21 09:11或2025-03-19 09:16:11，fromisoformat比strptime快得多
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field}时间格式无法识别: {value!r}") from None
+
+
+def get_str(record, field, default=''):
+    """读取字符串字段，null按默认值处理"""
+    value = record.get(field)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"{field}应为字符串: {value!r}")
+    return value
+
+
+class Question:
+    """
+    一道错题
+
+    知识点为去掉空字符串后的元组，字符串经过sys.intern，全班共用同一份；
+    时间同时保留原始文字（用于显示）和解析后的datetime；图片路径已解析为最终路径。
+    """
+
+    __slots__ = (
+        'question_id', 'exam_name', 'error_reason', 'knowledge_points', 'review_count', 'exam_score',
+        'created_at', 'created_at_text', 'last_reviewed_at', 'last_reviewed_at_text',
+        'question_image_path', 'student_answer_image_path', 'student_answer_text', 'std_answer_image_path',
+    )
+
+    @classmethod
+    def from_dict(cls, record, image_store=None):
+        """
+        校验一条错题记录并转换为Question
+
+        参数:
+        record -- data.json中的一道题
+        image_store -- 全校共享图片库ImageStore，题目和标准答案图片通过它解析路径
+
+        返回:
+        Question实例；记录格式错误时抛出ValueError
+        """
+        if not isinstance(record, dict):
+            raise ValueError(f"错题记录应为对象: {record!r}")
+
+        question = cls()
+        question_id = record.get('question_id', '')
+        if not isinstance(question_id, (str, int)) or isinstance(question_id, bool):
+            raise ValueError(f"question_id应为字符串或整数: {question_id!r}")
+        question.question_id = str(question_id)
+        question.exam_name = sys.intern(get_str(record, 'exam_name', '未分类'))
+        question.error_reason = get_str(record, 'error_reason')
+
+        knowledge_points = record.get('knowledge_points') or []
+        if not isinstance(knowledge_points, list) or not all(isinstance(kp, str) for kp in knowledge_points):
+            raise ValueError(f"knowledge_points应为字符串列表: {knowledge_points!r}")
+        question.knowledge_points = tuple(sys.intern(kp) for kp in knowledge_points if kp)
+
+        review_count = record.get('review_count') or 0
+        if not isinstance(review_count, int) or isinstance(review_count, bool) or review_count < 0:
+            raise ValueError(f"review_count应为非负整数: {review_count!r}")
+        question.review_count = review_count
+        exam_score = record.get('exam_score')
+        if exam_score is not None and (not isinstance(exam_score, (int, float)) or isinstance(exam_score, bool)):
+            raise ValueError(f"exam_score应为数字: {exam_score!r}")
+        question.exam_score = exam_score
+
+        question.created_at_text = get_str(record, 'created_at')
+        question.created_at = parse_time(question.created_at_text, 'created_at')
+        question.last_reviewed_at_text = get_str(record, 'last_reviewed_at')
+        question.last_reviewed_at = parse_time(question.last_reviewed_at_text, 'last_reviewed_at')
+
+        for field in IMAGE_PATH_FIELDS:
+            image_path = get_str(record, field)
+            if image_store is not None and field in SHARED_IMAGE_PATH_FIELDS:
+                image_path = image_store.resolve(image_path)
+            setattr(question, field, image_path)
+        question.student_answer_text = get_str(record, 'student_answer_text')
+        return question
+
+
+class MistakeNotebook:
+    """一个学生的错题本"""
+
+    __slots__ = ('student_id', 'name', 'questions')
+
+    def __init__(self, student_id, name, questions):
+        self.student_id = student_id
+        self.name = name
+        self.questions = questions
+
+
+def parse_notebook(data, image_store=None, source=''):
+    """
+    一次遍历校验并转换整本错题本，格式错误时立即报错，不会在渲染途中失败
+
+    参数:
+    data -- data.json的内容
+    image_store -- 共享图片库ImageStore，见Question.from_dict()
+    source -- 数据来源，用于错误信息
+
+    返回:
+    MistakeNotebook实例
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"{source}: 错题本应为对象")
+    records = data.get('questions') or []
+    if not isinstance(records, list):
+        raise ValueError(f"{source}: questions应为列表")
+
+    questions = []
+    for i, record in enumerate(records):
+        try:
+            questions.append(Question.from_dict(record, image_store))
+        except ValueError as e:
+            raise ValueError(f"{source}: 第{i + 1}道题格式错误: {e}") from None
+    return MistakeNotebook(str(data.get('student_id', '')), get_str(data, 'name'), questions)
+
+
+def load_notebook(json_file_path, image_store=None):
+    """
+    读取并校验错题本JSON文件
+
+    参数:
+    json_file_path -- JSON文件路径
+    image_store -- 共享图片库ImageStore，见Question.from_dict()
+
+    返回:
+    MistakeNotebook实例
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return parse_notebook(data, image_store, json_file_path)
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装Pillow时不生成缩略图，页面直接使用原图
+    Image = ImageOps = None
+
+# 缩略图宽度（像素），手机屏幕一般只需要最小的一档
+THUMBNAIL_WIDTHS = (320, 640, 960)
+# 缩略图缓存目录，与data.json中的图片路径一样相对于工作目录
+THUMBNAIL_DIR = os.path.join('figs', 'thumbs')
+# 浏览器据此从srcset中选择合适宽度：窄屏按整屏宽度，宽屏最多按卡片宽度
+THUMBNAIL_SIZES = '(max-width: 1000px) 100vw, 960px'
+
+
+def file_digest(image_path):
+    """
+    计算图片文件内容的SHA-1摘要，作为缩略图缓存的键
+
+    参数:
+    image_path -- 图片路径
+
+    返回:
+    十六进制摘要字符串
+    """
+    sha1 = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def build_thumbnail(image_path, thumbnail_dir=THUMBNAIL_DIR, widths=THUMBNAIL_WIDTHS):
+    """
+    为单张图片生成若干宽度的缩略图，已存在的缓存直接复用
+
+    参数:
+    image_path -- 原图路径
+    thumbnail_dir -- 缩略图缓存目录
+    widths -- 需要生成的缩略图宽度
+
+    返回:
+    按宽度升序排列的 [(宽度, 缩略图路径), ...]；原图不比最小宽度大时返回空列表
+    """
+    digest = file_digest(image_path)
+    thumbnails = []
+    source = None
+    try:
+        for width in sorted(widths):
+            thumbnail_path = os.path.join(thumbnail_dir, f"{digest}_{width}w.jpg")
+            if os.path.isfile(thumbnail_path):
+                thumbnails.append((width, thumbnail_path))
+                continue
+
+            if source is None:
+                with Image.open(image_path) as image:
+                    # 手机照片常带EXIF方向标记，浏览器显示原图时会按它旋转，缩略图和宽度档位都要按转正后的图片计算
+                    source = ImageOps.exif_transpose(image)
+            # 不放大图片，比原图还宽的档位直接跳过
+            if source.width <= width:
+                break
+
+            height = max(1, round(source.height * width / source.width))
+            thumbnail = source.convert('RGB').resize((width, height), Image.LANCZOS)
+            # 先写临时文件再改名，避免并行生成时读到半个文件；
+            # 内容相同的图片可能在不同线程（或不同进程）中同时生成同一个缩略图，临时文件名必须各不相同
+            tmp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            thumbnail.save(tmp_path, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp_path, thumbnail_path)
+            thumbnails.append((width, thumbnail_path))
+    finally:
+        if source is not None:
+            source.close()
+    return thumbnails
+
+
+def build_thumbnails(image_paths, thumbnail_dir=THUMBNAIL_DIR, widths=THUMBNAIL_WIDTHS, max_workers=None):
+    """
+    并行为一批图片生成缩略图
+
+    参数:
+    image_paths -- 原图路径列表，可以包含重复或空路径
+    thumbnail_dir -- 缩略图缓存目录
+    widths -- 需要生成的缩略图宽度
+    max_workers -- 线程数，默认由ThreadPoolExecutor决定
+
+    返回:
+    {原图路径: [(宽度, 缩略图路径), ...]}，未安装Pillow或处理失败的图片不在其中
+    """
+    if Image is None:
+        return {}
+
+    unique_paths = sorted({path for path in image_paths if path and os.path.isfile(path)})
+    if not unique_paths:
+        return {}
+
+    os.makedirs(thumbnail_dir, exist_ok=True)
+
+    def build(path):
+        try:
+            return path, build_thumbnail(path, thumbnail_dir, widths)
+        except Exception as e:
+            print(f"生成缩略图时出错 ({path}): {e}")
+            return path, []
+
+    # Pillow在解码、缩放和编码时会释放GIL，线程池即可并行
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(build, unique_paths)
+        return {path: thumbnails for path, thumbnails in results if thumbnails}